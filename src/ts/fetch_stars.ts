@@ -1,25 +1,39 @@
-import axios, { AxiosInstance } from "axios";
-import { createObjectCsvWriter } from "csv-writer";
+import axios, { AxiosInstance, AxiosResponse } from "axios";
+import { existsSync, readFileSync, writeFileSync } from "fs";
+import { Agent } from "https";
 import * as yargs from "yargs";
 
 type Star = {
   starred_at: string;
 };
 
+type Cache = {
+  repo: string;
+  starredAt: string[];
+};
+
+const maxInFlight = 10;
+// GitHub returns 30 items per page by default and 100 at most
+const perPage = 100;
+// Non-global so that `exec` keeps no `lastIndex` state between calls
+const lastPagePattern = /[?&]page=(\d+)[^>]*>; rel="last"/;
+
 function createApi(token: string): AxiosInstance {
   return axios.create({
     baseURL: "https://api.github.com/",
+    // Reuse TCP/TLS connections across pages instead of a handshake per request
+    httpsAgent: new Agent({ keepAlive: true, maxSockets: maxInFlight }),
     headers: {
       Accept: "application/vnd.github.v3.star+json",
+      // axios decompresses gzip bodies but doesn't ask for them by default
+      "Accept-Encoding": "gzip",
       Authorization: token ? `token ${token}` : undefined,
     },
   });
 }
 
 function extractLastPage(link: string): number {
-  const pattern = /\?page=(\d+)>; rel="last"/g;
-
-  const match = pattern.exec(link);
+  const match = lastPagePattern.exec(link);
 
   if (match === null) {
     return 0;
@@ -27,6 +41,60 @@ function extractLastPage(link: string): number {
   return parseInt(match[1]);
 }
 
+async function fetchPages<T>(
+  api: AxiosInstance,
+  urls: string[],
+  concurrency: number
+): Promise<AxiosResponse<T>[]> {
+  const results: AxiosResponse<T>[] = new Array(urls.length);
+  let next = 0;
+
+  // Each worker picks up the next url as soon as its previous request settles
+  async function worker(): Promise<void> {
+    while (next < urls.length) {
+      const index = next++;
+      results[index] = await api.get<T>(urls[index]);
+    }
+  }
+
+  const workers = Array.from(Array(Math.min(concurrency, urls.length)), () =>
+    worker()
+  );
+  await Promise.all(workers);
+  return results;
+}
+
+function readCache(path: string, repo: string): string[] {
+  if (!existsSync(path)) {
+    return [];
+  }
+
+  const cache: Cache = JSON.parse(readFileSync(path, "utf8"));
+  // Ignore a cache written for another repository
+  return cache.repo === repo ? cache.starredAt : [];
+}
+
+async function isCachedPageCurrent(
+  api: AxiosInstance,
+  starEndPoint: string,
+  cached: string[],
+  page: number
+): Promise<boolean> {
+  const resp = await api.get<Star[]>(
+    `${starEndPoint}?per_page=${perPage}&page=${page}`
+  );
+  const expected = cached.slice((page - 1) * perPage, page * perPage);
+  return (
+    resp.data.length === expected.length &&
+    resp.data.every(({ starred_at }, i) => starred_at === expected[i])
+  );
+}
+
+function writeCache(path: string, repo: string, starredAt: string[]): void {
+  const cache: Cache = { repo, starredAt };
+  writeFileSync(path, JSON.stringify(cache));
+}
+
 function getToken(): string | undefined {
   return process.env.GITHUB_TOKEN;
 }
@@ -36,6 +104,7 @@ function parseArgs(): {
   owner: unknown;
   repo: unknown;
   csv_path: string;
+  cache_path: string | undefined;
   _: string[];
   $0: string;
 } {
@@ -55,13 +124,17 @@ function parseArgs(): {
       description: "output csv path",
       default: "stars.csv",
     })
+    .option("cache_path", {
+      description: "json file to reuse previously fetched stars from",
+      type: "string",
+    })
     .help();
 
   return argv;
 }
 
 async function main(): Promise<void> {
-  const { owner, repo, csv_path } = parseArgs();
+  const { owner, repo, csv_path, cache_path } = parseArgs();
 
   const token = getToken();
   if (token === undefined || token === "") {
@@ -70,46 +143,58 @@ async function main(): Promise<void> {
   }
 
   const api = createApi(token);
-  const starEndPoint = `repos/${owner}/${repo}/stargazers`;
-  const resp = await api.get(starEndPoint);
-  const lastPage = extractLastPage(resp.headers.link);
-  const pages = Array.from(Array(lastPage), (_, i) => i + 1);
-  const urls = pages.map(page => `${starEndPoint}?page=${page}`);
-
-  // Split the API requests into small chunks to prevent GitHub from raising the rate-limit error
-  let stars: Star[] = [];
-  const chunkSize = 30;
-  const indices = Array.from(Array(Math.ceil(lastPage / chunkSize)).keys());
-
-  for (const index of indices) {
-    const start = index * chunkSize;
-    const end = (index + 1) * chunkSize;
-    const promises = urls.slice(start, end).map(url => api.get(url));
-
-    try {
-      const chunk = await Promise.all(promises);
-      stars = stars.concat(
-        chunk
-          .map(s => s.data)
-          .reduce((a, b) => [...a, ...b], [])
-          .map(({ starred_at }: Star) => ({ starred_at }))
-      );
-    } catch (err) {
-      throw err;
+  const fullName = `${owner}/${repo}`;
+  const starEndPoint = `repos/${fullName}/stargazers`;
+
+  // Stars are listed oldest first, so pages that were full when cached only change if
+  // someone unstars. Refetch from the first page that wasn't full.
+  const cached = cache_path ? readCache(cache_path, fullName) : [];
+  let firstPage = Math.floor(cached.length / perPage) + 1;
+  // An unstar shifts every later star back, so the last cached full page no longer
+  // matches GitHub's. In that case the cached pages can't be trusted.
+  if (
+    firstPage > 1 &&
+    !(await isCachedPageCurrent(api, starEndPoint, cached, firstPage - 1))
+  ) {
+    console.log("Cached stars are outdated, fetching all pages");
+    firstPage = 1;
+  }
+  const firstResp = await api.get(
+    `${starEndPoint}?per_page=${perPage}&page=${firstPage}`
+  );
+  // Without a "last" link, the requested page is the last one
+  const lastPage = Math.max(extractLastPage(firstResp.headers.link), firstPage);
+  const pages = Array.from(
+    Array(lastPage - firstPage),
+    (_, i) => i + firstPage + 1
+  );
+  const urls = pages.map(
+    page => `${starEndPoint}?per_page=${perPage}&page=${page}`
+  );
+
+  // Bound the number of in-flight requests to prevent GitHub from raising the rate-limit error
+  const rest = await fetchPages<Star[]>(api, urls, maxInFlight);
+  const resps = [firstResp, ...rest];
+  // Only starred_at is used, so keep a flat array of strings rather than an object per star
+  const starredAt = cached.slice(0, (firstPage - 1) * perPage);
+  for (const resp of resps) {
+    for (const { starred_at } of resp.data as Star[]) {
+      starredAt.push(starred_at);
     }
   }
 
-  const csvWriter = createObjectCsvWriter({
-    path: csv_path,
-    header: [{ id: "starred_at", title: "starred_at" }],
-  });
-
-  csvWriter.writeRecords(stars).then(() => {
-    console.log("Done");
-  });
+  // ISO 8601 timestamps contain no characters that need quoting
+  writeFileSync(csv_path, ["starred_at", ...starredAt].join("\n") + "\n");
+  if (cache_path) {
+    writeCache(cache_path, fullName, starredAt);
+  }
+  console.log("Done");
 
-  const rateLimit = await api.get("rate_limit");
-  console.log(rateLimit.data);
+  // Every API response reports the remaining rate limit, so no extra request is needed
+  const remaining = Math.min(
+    ...resps.map(resp => parseInt(resp.headers["x-ratelimit-remaining"]))
+  );
+  console.log(`Rate limit remaining: ${remaining}`);
 }
 
 main();